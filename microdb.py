@@ -2,15 +2,127 @@
 # microdb.py a PICKLED micro-database
 # of key-value pairs
 #
-# version 0.1
+# version 0.2
 ###############################################
+import functools
+import io
 import json
 import pickle, os
 import re
+import stat
+import struct
 import uuid
+import zlib
+from collections.abc import Mapping, MutableMapping
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
-class MicroDB:
-    def __init__(self, filename, preload=True, exist=False):
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+try:
+    import re2
+except ImportError:
+    re2 = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+FORMATS = ('pickle', 'msgpack')
+ENGINES = ('re', 're2')
+# 'none' leaves writes in our buffer, 'flush' hands them to the OS page cache,
+# 'fsync' forces them to disk
+DURABILITY = ('none', 'flush', 'fsync')
+# frame magic number, used to detect compressed database files on load
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+# file buffer size, large enough that pickle's many small writes become few syscalls
+BUFFER_SIZE = 1 << 20
+# append-only log records are prefixed with their length
+_LOG_HEADER = struct.Struct('<I')
+# the log opens with the checksum and size of the database file it follows,
+# a log left over from an older file is ignored
+_LOG_MAGIC = b'MDBLOG\x01\x00'
+_LOG_START = struct.Struct('<8sIQ')
+# sentinel for dictionary lookups where None is a valid value
+_MISSING = object()
+
+@functools.lru_cache(maxsize=256)
+def _compile(pattern, engine='re'):
+    """
+    _compile(pattern, engine='re') - private cached compile, a pattern is
+        compiled once per engine and reused across searches, an already
+        compiled pattern is returned unchanged
+    """
+    if not isinstance(pattern, (str, bytes)):
+        return pattern
+    if engine == 're2':
+        return re2.compile(pattern)
+    return re.compile(pattern)
+
+def _json_dumps(obj):
+    """
+    _json_dumps(obj) - private JSON encode to bytes with the json module
+    """
+    return json.dumps(obj).encode('utf-8')
+
+def _json_loads(data):
+    """
+    _json_loads(data) - private JSON decode of bytes with the json module
+    """
+    return json.loads(data)
+
+class _ChecksumWriter:
+    """
+    _ChecksumWriter(fileobject) - private file wrapper, keeps the crc32 of
+        everything written through it
+    """
+    def __init__(self, fileobject):
+        self.fileobject = fileobject
+        self.crc = 0
+    
+    def write(self, data):
+        self.crc = zlib.crc32(data, self.crc)
+        return self.fileobject.write(data)
+    
+    def flush(self):
+        self.fileobject.flush()
+
+def _is_msgpack(header):
+    """
+    _is_msgpack(header) - private sniff of the first bytes of a file,
+        True if it holds a msgpack map rather than a pickle
+    """
+    if not header:
+        return False
+    first = header[0]
+    if first == 0x80:
+        # pickle protocol 2+ opens with 0x80 <protocol>, a lone 0x80 is an empty msgpack map
+        return len(header) == 1
+    return 0x81 <= first <= 0x8f or first in (0xde, 0xdf)
+
+class MicroDB(MutableMapping):
+    """
+    MicroDB - a persistent dictionary, db[key], key in db, del db[key] and
+        len(db) work like a dict and save to disk like add/update/delete.
+        update() takes either (key, data) for an existing key, or a dict
+        and keyword arguments and then adds keys like dict.update().
+        Databases compare and hash by identity, not by their contents.
+        
+        db.datastore may be replaced wholesale, but after writing into it in
+        place (db.datastore[key] = value) call db.datastore_changed(), otherwise
+        find() uses a stale index. add/update/delete and db[key] need no call.
+    """
+    def __init__(self, filename, preload=True, exist=False, format='pickle', log=False,
+                 engine='re', durability='flush', compress=False, background=False):
         """
         MicroDB(filename, preload) - init constructor sets up the datastore
             and loads if preload is True
@@ -21,19 +133,102 @@ class MicroDB:
                 False does not preload datastore.
             exist - boolean (optional False) files does not have to exist,
                 True if it must prexist
+            format - string (optional 'pickle') format used when saving,
+                'msgpack' is faster but only holds JSON-like values, saving
+                tuples or other values it cannot read back raises ValueError.
+                Existing files of either format are detected on load.
+            log - boolean (optional False) True appends each add/update/delete
+                to <filename>.log instead of rewriting the whole file,
+                the log is compacted into the file when it grows
+            engine - string (optional 're') regular expression engine for searches,
+                're2' uses google-re2, linear time even for pathological patterns
+            durability - string (optional 'flush') when writes reach the disk,
+                'flush' leaves them in the OS page cache, 'fsync' syncs every save
+                or log record to disk, 'none' also lets log records sit in the
+                file buffer until it fills, compact() or close()
+            compress - boolean (optional False) True compresses the saved file
+                with zstandard, compressed files are detected on load
+            background - boolean (optional False) True writes saves to disk on a
+                worker thread so callers do not wait on I/O, see wait(). A failed
+                save is raised by the next save, close() or wait()
         
         raises
             raises as error if no file
+            ValueError if the format, engine or durability is unknown
+                or its package is not installed
         """
+        if format not in FORMATS:
+            raise ValueError("Unknown format: {}".format(format))
+        if format == 'msgpack' and msgpack is None:
+            raise ValueError("format='msgpack' requires the msgpack package")
+        if engine not in ENGINES:
+            raise ValueError("Unknown engine: {}".format(engine))
+        if engine == 're2' and re2 is None:
+            raise ValueError("engine='re2' requires the google-re2 package")
+        if durability not in DURABILITY:
+            raise ValueError("Unknown durability: {}".format(durability))
+        if compress and zstandard is None:
+            raise ValueError("compress=True requires the zstandard package")
+        if background and log:
+            raise ValueError("background=True cannot be combined with log=True")
+        # find() index: value -> set of keys, key -> insertion number so
+        # results come back in datastore order, and the keys whose values
+        # are unhashable (compared one by one), built on first use
+        self._value_index = None
+        self._key_order = None
+        self._next_order = 0
+        self._unhashable = None
+        # True when the datastore holds changes the append-only log never saw
+        self._unlogged = False
         self.datastore = {}
         self.filename = filename
+        self.format = format
+        self.engine = engine
+        self.durability = durability
+        self.compress = compress
+        self.background = background
+        self._executor = None
+        self._pending = None
+        self._buffered = 0
+        self._dirty = False
+        # append-only log of mutations since the last full save (log=True only),
+        # _snapshot is (crc32, size) of the database file, _log_current True
+        # once the open log belongs to that file
+        self._log = None
+        self._snapshot = None
+        self._log_current = False
         if preload:
             self._load_data(filename, exist)
+        if log:
+            self._open_log()
+            
+    @property
+    def datastore(self):
+        """
+        datastore - the dictionary of key/value pairs
+        """
+        return self._datastore
+    
+    @datastore.setter
+    def datastore(self, datastore):
+        self._datastore = datastore
+        self.datastore_changed()
+    
+    def datastore_changed(self):
+        """
+        datastore_changed() - call after writing into db.datastore directly
+            rather than through add/update/delete, drops the find() index
+            and makes the next save write the whole file
+        """
+        self._value_index = None
+        self._key_order = None
+        self._unhashable = None
+        self._unlogged = True
             
     def _store_data(self, filename=None):
         """
         _store_data(<optional filename>) - private method to save as a pickle
-                dictionary serialization. Note, you can override the filename if needed
+                (or msgpack) dictionary serialization. Note, you can override the filename if needed
                 
         inputs
             filename - stores the data to disk
@@ -42,14 +237,239 @@ class MicroDB:
             boolean True if success
             
         raises
-            file error if cannot save
+            file error if cannot save, the existing file is left untouched,
+            with background=True the error of the previous save, if it failed,
+            raised after this save was started so it still writes everything
+        """
+        if filename is None:
+            filename = self.filename
+        if self._buffered > 0 and filename == self.filename:
+            # inside buffered(), defer the write until the block exits
+            self._dirty = True
+            return True
+        snapshot = filename == self.filename
+        if not self.background:
+            self._write_file(filename, self._dump, snapshot)
+            if snapshot:
+                self._unlogged = False
+            return True
+        # serialize now so later mutations cannot leak into this save,
+        # then hand the bytes to the writer thread
+        buf = io.BytesIO()
+        self._dump(buf)
+        data = buf.getvalue()
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1)
+        # the single worker keeps writes in order, report the previous
+        # failure only once the new full snapshot is queued behind it
+        pending = self._pending
+        self._pending = self._executor.submit(self._write_file, filename, lambda f: f.write(data), snapshot)
+        if snapshot:
+            self._unlogged = False
+        if pending is not None:
+            pending.result()
+        return True
+    
+    def _dump(self, out):
+        """
+        _dump(out) - private method, serialize the datastore into the
+            binary file object out, compressed if enabled
+        """
+        if self.compress:
+            cctx = zstandard.ZstdCompressor(level=3, threads=-1)
+            writer = cctx.stream_writer(out, closefd=False)
+        else:
+            writer = out
+        if self.format == 'msgpack':
+            # strict_types refuses tuples, which would come back as lists
+            # (and as unhashable keys), instead of silently converting them
+            try:
+                packed = msgpack.packb(self.datastore, use_bin_type=True, strict_types=True)
+            except (TypeError, OverflowError) as error:
+                raise ValueError("format='msgpack' cannot store this datastore: {}".format(error)) from error
+            writer.write(packed)
+        else:
+            pickle.dump(self.datastore, writer,
+                        protocol=pickle.HIGHEST_PROTOCOL, fix_imports=False)
+        if writer is not out:
+            # ends the compressed frame, out stays open
+            writer.close()
+    
+    def _write_file(self, filename, write, snapshot):
+        """
+        _write_file(filename, write, snapshot) - private method, call
+            write(fileobject) on a temporary file then swap it in as filename
+        
+        inputs
+            filename - file to write
+            write - function that writes the contents to the open file
+            snapshot - boolean True if filename is the database file itself
+        
+        outputs
+            boolean True if success
+        """
+        # write a temporary file and swap it in, a failed save never leaves a torn file
+        tmpname = filename + '.tmp'
+        try:
+            with open(tmpname, 'wb', buffering=BUFFER_SIZE) as foutput:
+                out = _ChecksumWriter(foutput)
+                write(out)
+                size = foutput.tell()
+                if self.durability == 'fsync':
+                    foutput.flush()
+                    os.fsync(foutput.fileno())
+            # keep the permissions of the file being replaced
+            try:
+                mode = stat.S_IMODE(os.stat(filename).st_mode)
+            except FileNotFoundError:
+                pass
+            else:
+                os.chmod(tmpname, mode)
+            os.replace(tmpname, filename)
+        except BaseException:
+            if os.path.exists(tmpname):
+                os.remove(tmpname)
+            raise
+        if self.durability == 'fsync' and hasattr(os, 'O_DIRECTORY'):
+            # make the rename itself durable
+            fd = os.open(os.path.dirname(os.path.abspath(filename)), os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        if snapshot:
+            # the file now holds every logged mutation, so the log starts over
+            self._snapshot = (out.crc, size)
+            if self._log is not None:
+                self._reset_log()
+            elif os.path.exists(self._log_filename(filename)):
+                os.remove(self._log_filename(filename))
+        return True
+    
+    def wait(self):
+        """
+        wait() - block until a background save has finished
+        
+        raises
+            the error of the background save if it failed
+        """
+        pending, self._pending = self._pending, None
+        if pending is not None:
+            pending.result()
+    
+    def _log_filename(self, filename=None):
+        """
+        _log_filename(<optional filename>) - private method, name of the
+            append-only log that goes with the database file
         """
         if filename is None:
             filename = self.filename
-        with open(filename, 'wb') as foutput:
-            pickle.dump(self.datastore, foutput)
+        return filename + '.log'
+    
+    def _open_log(self):
+        """
+        _open_log() - private method, open the append-only log for writing
+        """
+        self._log = open(self._log_filename(), 'ab', buffering=BUFFER_SIZE)
+        if self._snapshot is not None and not self._log_current:
+            self._reset_log()
+    
+    def _reset_log(self):
+        """
+        _reset_log() - private method, empty the append-only log and stamp
+            it with the checksum of the current database file
+        """
+        self._log.truncate(0)
+        self._log.write(_LOG_START.pack(_LOG_MAGIC, *self._snapshot))
+        self._log.flush()
+        if self.durability == 'fsync':
+            os.fsync(self._log.fileno())
+        self._log_current = True
+    
+    def _persist(self, *record):
+        """
+        _persist(*record) - private method to make a mutation durable,
+            appends record ('set', key, value) or ('del', key) to the log,
+            or saves the whole datastore when not logging
+            
+        outputs
+            boolean True if success
+        """
+        if (self._log is None or self._buffered > 0 or self._unlogged
+                or not self._log_current):
+            # the log cannot describe the change on its own, save everything
+            return self._store_data()
+        payload = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+        self._log.write(_LOG_HEADER.pack(len(payload)))
+        self._log.write(payload)
+        if self.durability != 'none':
+            self._log.flush()
+            if self.durability == 'fsync':
+                os.fsync(self._log.fileno())
+        if self._log.tell() > self._snapshot[1] // 2:
+            self.compact()
         return True
     
+    def _replay_log(self, filename, snapshot):
+        """
+        _replay_log(filename, snapshot) - private method, apply the mutations
+            logged in <filename>.log to the datastore, a torn final record is ignored
+        
+        inputs
+            filename - database file name
+            snapshot - (crc32, size) of the database file as loaded
+        
+        returns
+            True if the log belongs to the file and was replayed,
+            False if there is no log or it is left over from an older file
+        """
+        logname = self._log_filename(filename)
+        if not os.path.exists(logname):
+            return False
+        with open(logname, 'rb') as finput:
+            data = finput.read()
+        if len(data) < _LOG_START.size:
+            return False
+        magic, crc, size = _LOG_START.unpack_from(data)
+        if magic != _LOG_MAGIC or (crc, size) != snapshot:
+            return False
+        pos = _LOG_START.size
+        while pos + _LOG_HEADER.size <= len(data):
+            (length,) = _LOG_HEADER.unpack_from(data, pos)
+            pos += _LOG_HEADER.size
+            if pos + length > len(data):
+                break
+            record = pickle.loads(data[pos:pos + length])
+            pos += length
+            if record[0] == 'set':
+                self.datastore[record[1]] = record[2]
+            else:
+                self.datastore.pop(record[1], None)
+        return True
+    
+    def compact(self):
+        """
+        compact() - rewrite the database file and empty the append-only log
+        
+        outputs
+            boolean True if success
+        """
+        return self._store_data()
+    
+    def close(self):
+        """
+        close() - finish any background save and close the append-only log, if any
+        """
+        try:
+            self.wait()
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+    
     def _load_data(self, filename=None, exists=False):
         """
         _load_data( <optional filename> ) - private method load the data, 
@@ -69,9 +489,27 @@ class MicroDB:
         if filename is None:
             filename = self.filename
         if os.path.exists(filename):
-            # PRIVATE load data from pickle serialized file
+            # PRIVATE load data from pickle or msgpack serialized file
+            # read the file once, deserializing from memory is faster than streaming
             with open(filename, 'rb') as finput:
-                self.datastore = pickle.load(finput)
+                data = finput.read()
+            snapshot = (zlib.crc32(data), len(data))
+            if data[:4] == ZSTD_MAGIC:
+                if zstandard is None:
+                    raise ValueError("{} is compressed, install zstandard to load it".format(filename))
+                data = zstandard.ZstdDecompressor().decompressobj().decompress(data)
+            if _is_msgpack(data[:2]):
+                if msgpack is None:
+                    raise ValueError("{} is msgpack, install msgpack to load it".format(filename))
+                self.datastore = msgpack.unpackb(data, raw=False, strict_map_key=False)
+            else:
+                self.datastore = pickle.loads(data)
+            replayed = self._replay_log(filename, snapshot)
+            if filename == self.filename:
+                # the datastore matches the file plus its log
+                self._snapshot = snapshot
+                self._log_current = replayed
+                self._unlogged = False
             return self.datastore
         
         if exists:
@@ -92,6 +530,26 @@ class MicroDB:
         """
         self._store_data(filename)
     
+    @contextmanager
+    def buffered(self):
+        """
+        buffered() - context manager that suppresses writes to disk and
+            saves the datastore once when the outermost block exits
+        
+        usage
+            with db.buffered():
+                for key, value in items:
+                    db.add(key, value)
+        """
+        self._buffered += 1
+        try:
+            yield self
+        finally:
+            self._buffered -= 1
+            if self._buffered == 0 and self._dirty:
+                self._dirty = False
+                self._store_data()
+    
     def purge(self, clear_datastore=False):
         """
         purge() - PUBLIC clear/delete persistent storage, but not existing data
@@ -103,6 +561,13 @@ class MicroDB:
         outputs
             boolean True if file is removed, False if not
         """
+        self.wait()
+        if self._log is not None:
+            self._log.truncate(0)
+        elif os.path.exists(self._log_filename()):
+            os.remove(self._log_filename())
+        self._snapshot = None
+        self._log_current = False
         if os.path.exists(self.filename):
             os.remove(self.filename)
             return True
@@ -120,6 +585,11 @@ class MicroDB:
             None
         """
         self.filename = filename
+        self._snapshot = None
+        self._log_current = False
+        if self._log is not None:
+            self._log.close()
+            self._open_log()
         if save:
             self._store_data()
     
@@ -130,8 +600,52 @@ class MicroDB:
         outputs
             integer - number of keys in the datastore
         """
-        keys = self.datastore.keys()
-        return len(keys)
+        return len(self.datastore)
+    
+    __len__ = length
+    
+    # Mapping would compare by contents and make instances unhashable
+    __eq__ = object.__eq__
+    __hash__ = object.__hash__
+    
+    def __getitem__(self, key):
+        """
+        db[key] - value stored at key, raises KeyError if not present
+        """
+        return self.datastore[key]
+    
+    def __setitem__(self, key, data):
+        """
+        db[key] = data - add or update key and save to disk
+        """
+        if not self._update_key(key, data, True):
+            self.add(key, data)
+    
+    def __delitem__(self, key):
+        """
+        del db[key] - delete key and save to disk, raises KeyError if not present
+        """
+        if not self.delete(key):
+            raise KeyError(key)
+    
+    def __iter__(self):
+        """
+        iter(db) - iterate over the keys of the datastore
+        """
+        return iter(self.datastore)
+    
+    def __contains__(self, key):
+        """
+        key in db - True if key is in the datastore
+        """
+        return key in self.datastore
+    
+    def clear(self):
+        """
+        clear() - remove every key and save to disk once
+        """
+        with self.buffered():
+            super().clear()
     
     def add(self, key, data, save=True):
         """
@@ -145,12 +659,17 @@ class MicroDB:
         returns
             boolean - True if saved to datastore, False if key already present.
         """
-        if not(key in self.datastore):
-            self.datastore[key] = data
-            if save:
-                self._store_data()
-            return True
-        return False
+        # setdefault inserts only when the key is new, in a single lookup
+        size = len(self.datastore)
+        self.datastore.setdefault(key, data)
+        if len(self.datastore) == size:
+            return False
+        self._index_add(key, data)
+        if save:
+            self._persist('set', key, data)
+        else:
+            self._unlogged = True
+        return True
     
     def addkey(self, data, save=True):
         """
@@ -179,8 +698,7 @@ class MicroDB:
            None if no matching key
            otherwise returns the value contained in the keu
         """
-        if key in self.datastore:
-            return self.datastore[key]
+        return self.datastore.get(key)
         
     def findkeys(self, keys):
         """
@@ -198,7 +716,117 @@ class MicroDB:
             if item:
                 data.append(item)
         return data
-            
+    
+    def _build_index(self):
+        """
+        _build_index() - private method that (re)builds the value index
+            used by find(), keys of unhashable values are kept aside
+        
+        returns
+            the value index dictionary
+        """
+        self._value_index = {}
+        self._key_order = {}
+        self._next_order = 0
+        self._unhashable = set()
+        for k, v in self.datastore.items():
+            self._index_add(k, v)
+        return self._value_index
+    
+    def _index_add(self, key, value):
+        """
+        _index_add(key, value) - private method, record key under value
+            in the value index if it has been built
+        """
+        if self._value_index is None:
+            return
+        if key not in self._key_order:
+            self._key_order[key] = self._next_order
+            self._next_order += 1
+        try:
+            self._value_index.setdefault(value, set()).add(key)
+        except TypeError:
+            self._unhashable.add(key)
+    
+    def _index_remove(self, key, value, deleted=False):
+        """
+        _index_remove(key, value, deleted=False) - private method, drop key
+            from under value in the value index if it has been built,
+            deleted True if the key has left the datastore
+        """
+        if self._value_index is None:
+            return
+        if deleted:
+            self._key_order.pop(key, None)
+        try:
+            keys = self._value_index.get(value)
+        except TypeError:
+            self._unhashable.discard(key)
+            return
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._value_index[value]
+        
+    def iterfind(self, data=None):
+        """
+        iterfind(data) - generator of matching keys/values
+        
+        inputs
+            data=None yields ALL keyvalue pairs
+                 data=any, looks for matches in key and/or values
+        yields
+            (key, value) tuples, do not modify the datastore while iterating
+        """
+        if data is None:
+            yield from self.datastore.items()
+            return
+        
+        try:
+            hash(data)
+            # NaN and the like never equal themselves, a dict lookup would match them
+            indexable = data == data
+        except TypeError:
+            indexable = False
+        if not indexable:
+            # unhashable data can only be matched by a full scan
+            for k,v in self.datastore.items():
+                if data == k or data == v:
+                    yield (k, v)
+            return
+        
+        if self._value_index is None:
+            self._build_index()
+        keys = self._index_lookup(data)
+        if keys is None:
+            # db.datastore was written to directly, start over
+            self._build_index()
+            keys = self._index_lookup(data)
+        for k in sorted(keys, key=self._key_order.__getitem__):
+            yield (k, self.datastore[k])
+    
+    def _index_lookup(self, data):
+        """
+        _index_lookup(data) - private method, keys whose key or value
+            equals the hashable data according to the value index
+        
+        returns
+            set of keys, or None if the index is out of date
+        """
+        keys = set()
+        for k in self._value_index.get(data, ()):
+            value = self.datastore.get(k, _MISSING)
+            if value is _MISSING or not (value == data):
+                return None
+            keys.add(k)
+        for k in self._unhashable:
+            if self.datastore.get(k, _MISSING) == data:
+                keys.add(k)
+        if data in self.datastore:
+            keys.add(data)
+        if any(k not in self._key_order for k in keys):
+            return None
+        return keys
         
     def find(self, data=None):
         """
@@ -208,17 +836,12 @@ class MicroDB:
             data=None returns ALL keyvalue pairs
                  data=any, looks for matches in key and/or values
         returns
-            an array of dictionaries
+            a list of (key, value) tuples (before version 0.2 it was
+            a list of single entry dictionaries), see iterfind()
         """
-        found = []
-        for k,v in self.datastore.items():
-            if data is None:
-                found.append({k:v})
-            else:
-                if data == k or data == v:
-                    found.append({k:v})
-                
-        return found
+        if data is None:
+            return list(self.datastore.items())
+        return list(self.iterfind(data))
     
     def search(self, pattern):
         """
@@ -230,17 +853,18 @@ class MicroDB:
         returns
              a list of keys that match
         """
-        found = []
-        for key, value in self.datastore.items():
-            if isinstance(value, str):
-                x = re.search(pattern, value)
-                if x:
-                    found.append(key)            
-        return found
+        rx = _compile(pattern, self.engine)
+        return [key for key, value in self.datastore.items()
+                if type(value) is str and rx.search(value)]
     
-    def update(self, key, data, save=True):
+    def update(self, *args, save=True, **kwargs):
         """
-        update(key, data, save=True)
+        update(key, data, save=True) - update the value of an existing key,
+            a missing key is not added
+        update(other=(), save=True, **kwargs) - like dict.update(), add or
+            update every key/value of a dict (or iterable of pairs) and of the
+            keyword arguments, saved to disk once. A key named save can only
+            be given in other
         
         inputs
             key - dictionary key
@@ -248,14 +872,56 @@ class MicroDB:
             save - (optional default True) True saves to disk, False does not
         outputs
             True if data was sucessfully entered into datastore
-            False if it failed
+            False if it failed (key not present)
         """
-        if key in self.datastore:
-            self.datastore[key] = data
-            if save:
-                self._store_data()
-            return True
-        return False
+        if len(args) <= 1:
+            return self._update_from(args[0] if args else (), kwargs, save)
+        if len(args) == 3:
+            key, data, save = args
+        elif len(args) == 2:
+            key, data = args
+        else:
+            raise TypeError("update() takes (key, data, save) or (other), got {} arguments".format(len(args)))
+        if kwargs:
+            raise TypeError("update(key, data) takes no keyword arguments")
+        return self._update_key(key, data, save)
+    
+    def _update_key(self, key, data, save):
+        """
+        _update_key(key, data, save) - private method behind update(key, data)
+        """
+        old = self.datastore.get(key, _MISSING)
+        if old is _MISSING:
+            return False
+        self.datastore[key] = data
+        self._index_remove(key, old)
+        self._index_add(key, data)
+        if save:
+            self._persist('set', key, data)
+        else:
+            self._unlogged = True
+        return True
+    
+    def _update_from(self, other, kwargs, save):
+        """
+        _update_from(other, kwargs, save) - private method behind the
+            dict.update() form of update()
+        """
+        if isinstance(other, Mapping):
+            items = other.items()
+        elif hasattr(other, 'keys'):
+            items = ((k, other[k]) for k in other.keys())
+        else:
+            items = other
+        changed = False
+        for pairs in (items, kwargs.items()):
+            for k, v in pairs:
+                if not self._update_key(k, v, False):
+                    self.add(k, v, save=False)
+                changed = True
+        if save and changed:
+            self._store_data()
+        return True
     
     def delete(self, key, save=True):
         """
@@ -265,12 +931,15 @@ class MicroDB:
             key - the key to delete
             save - (optional default True) True saves to disk, False does not
         """
-        if key in self.datastore:
-            del self.datastore[key]
-            if save:
-                self._store_data()
-            return True
-        return False
+        old = self.datastore.pop(key, _MISSING)
+        if old is _MISSING:
+            return False
+        self._index_remove(key, old, deleted=True)
+        if save:
+            self._persist('del', key)
+        else:
+            self._unlogged = True
+        return True
     
     def search_subkey(self, key, pattern):
         """
@@ -278,16 +947,17 @@ class MicroDB:
         
         inputs
             key - subkey to search for string
-            pattern - regular expression to search subkeys
+            pattern - regular expression (string or compiled) to search subkeys
             
         outputs
             list of keys which contain the regular expression
         """
+        rx = _compile(pattern, self.engine)
         found = []
         for k, v in self.datastore.items():
             if key in v:
                 txt = v[key]
-                x = re.search(pattern, txt)
+                x = rx.search(txt)
                 if x:
                     found.append(k)
         return found
@@ -302,11 +972,19 @@ class MicroDB:
             pattern - regular expression to search subkeys
             
         outputs
-            list of keys which contain the regular expression
+            list of keys which contain the regular expression in any of
+            the subkeys (each key is listed once)
         """
+        rx = _compile(pattern, self.engine)
         found = []
-        for key in keys:
-            found += self.search_subkey(key, pattern)
+        for k, v in self.datastore.items():
+            if not isinstance(v, dict):
+                continue
+            for key in keys:
+                txt = v.get(key)
+                if isinstance(txt, str) and rx.search(txt):
+                    found.append(k)
+                    break
         return found
     
     def to_json(self, filename):
@@ -321,30 +999,57 @@ class MicroDB:
            
         raise error is it could not
         """
-        with open(filename, 'w') as fd:
-            fd.write(json.dumps(self.datastore))
+        with open(filename, 'wb') as fd:
+            fd.write(_json_dumps(self.datastore))
         return True
     
-    def load_json(self, filename, save=True):
+    def _read_json(self, filename):
+        """
+        _read_json(filename) - private method, parse a JSON object file
+        
+        returns
+            the parsed dictionary
+        """
+        with open(filename, 'rb') as fd:
+            return _json_loads(fd.read())
+    
+    def _iter_json(self, filename):
+        """
+        _iter_json(filename) - private generator of the key/value pairs of
+            a JSON object file, parsed incrementally with ijson
+        
+        raises
+            ValueError if ijson is not installed
+        """
+        if ijson is None:
+            raise ValueError("streaming=True requires the ijson package")
+        with open(filename, 'rb') as fd:
+            yield from ijson.kvitems(fd, '', use_float=True)
+    
+    def load_json(self, filename, save=True, streaming=False):
         """
         load_json(filename) - load internal datastore from JSON
         
         inputs
             filename - filename to save (no existential check)
             save - boolean True indicates it saves to disk, False if not
+            streaming - boolean (optional False) True parses the file
+                incrementally (needs ijson), for files too large to read at once
             
         outputs
             boolean True
             
         raises error if file in NOT JSON
         """
-        with open(filename, 'rb') as fd:
-            self.datastore = json.loads(fd.read())
+        if streaming:
+            self.datastore = dict(self._iter_json(filename))
+        else:
+            self.datastore = self._read_json(filename)
         if save:
             self.save()
         return True
             
-    def append_json(self, filename, save=True, duplicate=False):
+    def append_json(self, filename, save=True, duplicate=False, streaming=False):
         """
         append_json(filename) - append JSON
         
@@ -353,23 +1058,31 @@ class MicroDB:
             save - boolean (optional True) indicates it saves to disk, False if not
             duplicate - boolean (optional True) allow duplicate keys to UPDATE,
                 False if no UPDATE of key.
+            streaming - boolean (optional False) True parses the file
+                incrementally (needs ijson), for files too large to read at once
             
         outputs
             boolean - True if success, False if failed
         """
-        with open(filename, 'rb') as fd:
-            datastore = json.loads(fd.read())
-            
-        for key, data in datastore.items():
-            if self.findkey(key):
-                dsave = self.add(key, data, save)
-            elif duplicate:
-                dsave = self.update(key, data, save)
-            else:
-                dsave = False
-
-            if not dsave:
-                print("Error append_json() to datastore on id:{}".format(key))
+        # the datastore is saved once at the end, not per key
+        if streaming:
+            # item by item, so the parsed file is never held twice
+            for key, data in self._iter_json(filename):
+                if key not in self.datastore:
+                    self.add(key, data, save=False)
+                elif duplicate:
+                    self.update(key, data, save=False)
+                else:
+                    print("Error append_json() to datastore on id:{}".format(key))
+        else:
+            datastore = self._read_json(filename)
+            if not duplicate and self.datastore:
+                for key in [key for key in datastore if key in self.datastore]:
+                    print("Error append_json() to datastore on id:{}".format(key))
+                    del datastore[key]
+            # one bulk merge, the dict is resized once rather than per key
+            self.datastore.update(datastore)
+            self.datastore_changed()
                 
         if save:
             self.save()
@@ -0,0 +1,312 @@
+import datetime
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import microdb
+from microdb import MicroDB
+
+
+class MicroDBTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'test.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write_json(self, data, name='data.json'):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, 'w') as fd:
+            json.dump(data, fd)
+        return path
+
+
+class TestPersistence(MicroDBTestCase):
+    def test_round_trip(self):
+        db = MicroDB(self.filename)
+        db.add('a', 1)
+        db.add('b', [1, 2])
+        self.assertEqual(MicroDB(self.filename).datastore, {'a': 1, 'b': [1, 2]})
+
+    def test_buffered_saves_once_on_exit(self):
+        db = MicroDB(self.filename)
+        with db.buffered():
+            db.add('a', 1)
+            db.add('b', 2)
+            self.assertFalse(os.path.exists(self.filename))
+        self.assertEqual(MicroDB(self.filename).datastore, {'a': 1, 'b': 2})
+
+    def test_failed_save_keeps_previous_file(self):
+        db = MicroDB(self.filename)
+        db.add('a', 1)
+        db.add('bad', lambda: 0, save=False)
+        with self.assertRaises(Exception):
+            db.save()
+        self.assertEqual(MicroDB(self.filename).datastore, {'a': 1})
+        self.assertEqual(os.listdir(self.tmpdir), ['test.db'])
+
+    @unittest.skipUnless(os.name == 'posix', "POSIX permissions")
+    def test_save_keeps_permissions(self):
+        db = MicroDB(self.filename)
+        db['a'] = 1
+        os.chmod(self.filename, 0o600)
+        db['b'] = 2
+        self.assertEqual(os.stat(self.filename).st_mode & 0o777, 0o600)
+
+    @unittest.skipIf(microdb.msgpack is None, "msgpack not installed")
+    def test_msgpack_round_trip(self):
+        db = MicroDB(self.filename, format='msgpack')
+        db['a'] = {'n': [1, 2.5, 'x']}
+        db[3] = b'bytes'
+        db.close()
+        self.assertEqual(MicroDB(self.filename).datastore, {'a': {'n': [1, 2.5, 'x']}, 3: b'bytes'})
+
+    @unittest.skipIf(microdb.msgpack is None, "msgpack not installed")
+    def test_msgpack_rejects_tuples(self):
+        db = MicroDB(self.filename, format='msgpack')
+        db['a'] = 1
+        for key, value in [((1, 2), 'x'), ('t', (1, 2)), ('n', {'t': (1,)})]:
+            with self.assertRaises(ValueError):
+                db[key] = value
+            del db.datastore[key]
+        self.assertEqual(MicroDB(self.filename).datastore, {'a': 1})
+
+    @unittest.skipIf(microdb.zstandard is None, "zstandard not installed")
+    def test_compressed_round_trip(self):
+        db = MicroDB(self.filename, compress=True)
+        db['a'] = 'x' * 1000
+        with open(self.filename, 'rb') as fd:
+            self.assertEqual(fd.read(4), microdb.ZSTD_MAGIC)
+        self.assertEqual(MicroDB(self.filename)['a'], 'x' * 1000)
+
+
+class TestLog(MicroDBTestCase):
+    def test_unsaved_changes_survive_a_logged_save(self):
+        db = MicroDB(self.filename, log=True)
+        with db.buffered():
+            for i in range(1000):
+                db.add('k{}'.format(i), i)
+        db.add('b', 2, save=False)
+        db.update('k1', 'changed', save=False)
+        db.add('c', 3)
+        db.close()
+        db = MicroDB(self.filename)
+        self.assertEqual((db['b'], db['k1'], db['c']), (2, 'changed', 3))
+
+    def test_torn_final_record_is_ignored(self):
+        db = MicroDB(self.filename, log=True)
+        db.add('seed', 'x' * 1000)
+        db['x'] = 1
+        db['y'] = 2
+        db.close()
+        logname = self.filename + '.log'
+        with open(logname, 'rb+') as flog:
+            flog.truncate(os.path.getsize(logname) - 3)
+        db = MicroDB(self.filename)
+        self.assertEqual(db['x'], 1)
+        self.assertNotIn('y', db)
+
+    def test_stale_log_is_not_replayed(self):
+        db = MicroDB(self.filename, log=True)
+        db.add('seed', 'x' * 1000)
+        db['x'] = 1
+        db.close()
+        logname = self.filename + '.log'
+        with open(logname, 'rb') as flog:
+            stale = flog.read()
+        db = MicroDB(self.filename, log=True)
+        db.update('x', 'new', save=False)
+        db.save()
+        db.close()
+        with open(logname, 'wb') as flog:
+            flog.write(stale)
+        self.assertEqual(MicroDB(self.filename)['x'], 'new')
+
+    def test_compaction_empties_the_log(self):
+        db = MicroDB(self.filename, log=True)
+        db.save()
+        logname = self.filename + '.log'
+        empty = os.path.getsize(logname)
+        db['big'] = 'x' * (os.path.getsize(self.filename) // 2 + 1)
+        self.assertEqual(os.path.getsize(logname), empty)
+        db.close()
+        self.assertEqual(MicroDB(self.filename)['big'], db['big'])
+
+
+class TestBackground(MicroDBTestCase):
+    def test_saves_complete_after_close(self):
+        db = MicroDB(self.filename, background=True)
+        for i in range(100):
+            db[i] = i
+        db.close()
+        self.assertEqual(MicroDB(self.filename).datastore, dict((i, i) for i in range(100)))
+
+    def test_failed_write_is_reported(self):
+        missing = os.path.join(self.tmpdir, 'missing')
+        filename = os.path.join(missing, 'bg.db')
+        db = MicroDB(filename, background=True)
+        db['a'] = 1
+        self.assertIsInstance(db._pending.exception(), OSError)
+        os.mkdir(missing)
+        with self.assertRaises(OSError):
+            db['b'] = 2
+        db.close()
+        self.assertEqual(MicroDB(filename).datastore, {'a': 1, 'b': 2})
+
+    def test_log_is_rejected(self):
+        with self.assertRaises(ValueError):
+            MicroDB(self.filename, background=True, log=True)
+
+
+class TestFind(MicroDBTestCase):
+    def setUp(self):
+        super().setUp()
+        self.db = MicroDB(self.filename, preload=False)
+        for key, value in [('a', 1), ('b', 'x'), ('c', 1), ('x', [1])]:
+            self.db.add(key, value, save=False)
+
+    def test_find_returns_pairs(self):
+        self.assertEqual(self.db.find(), [('a', 1), ('b', 'x'), ('c', 1), ('x', [1])])
+        self.assertEqual(self.db.find(1), [('a', 1), ('c', 1)])
+        self.assertEqual(self.db.find('x'), [('b', 'x'), ('x', [1])])
+        self.assertEqual(self.db.find([1]), [('x', [1])])
+        self.assertEqual(list(self.db.iterfind(1)), [('a', 1), ('c', 1)])
+
+    def test_index_follows_mutations(self):
+        self.db.find(1)
+        self.db.update('a', 2, save=False)
+        self.db.delete('c', save=False)
+        self.db.add('d', 1, save=False)
+        self.assertEqual(self.db.find(1), [('d', 1)])
+        self.assertEqual(self.db.find(2), [('a', 2)])
+
+    def test_results_keep_datastore_order(self):
+        self.db.find(1)
+        self.db.update('a', 2, save=False)
+        self.db.update('a', 1, save=False)
+        self.assertEqual(self.db.find(1), [('a', 1), ('c', 1)])
+
+    def test_nan_never_matches(self):
+        nan = float('nan')
+        self.db.add('n', nan, save=False)
+        self.assertEqual(self.db.find(nan), [])
+
+    def test_unhashable_values_match_equal_data(self):
+        self.db.add('s', {1}, save=False)
+        self.assertEqual(self.db.find(frozenset({1})), [('s', {1})])
+        self.db.update('s', {2}, save=False)
+        self.assertEqual(self.db.find(frozenset({1})), [])
+
+    def test_direct_writes_do_not_break_find(self):
+        self.db.find(1)
+        self.db.datastore['b2'] = 1
+        self.assertEqual(self.db.find('b2'), [('b2', 1)])
+        self.assertEqual(self.db.find(1), [('a', 1), ('c', 1), ('b2', 1)])
+        del self.db.datastore['a']
+        self.db.datastore['c'] = 5
+        self.assertEqual(self.db.find(1), [('b2', 1)])
+
+    def test_replaced_datastore(self):
+        self.db.find(1)
+        self.db.datastore = {'z': 1}
+        self.assertEqual(self.db.find(1), [('z', 1)])
+
+
+class TestSearch(MicroDBTestCase):
+    def test_search_and_subkeys(self):
+        db = MicroDB(self.filename, preload=False)
+        db.datastore = {'a': 'hello', 'b': {'n': 'hi', 'm': 'zz'}, 'c': {'n': 'bye'}}
+        self.assertEqual(db.search('^hel'), ['a'])
+        self.assertEqual(db.search_subkey('n', 'b'), ['c'])
+        self.assertEqual(db.search_subkeys(['n', 'm'], 'h|z|y'), ['b', 'c'])
+
+
+class TestMapping(MicroDBTestCase):
+    def test_mapping_protocol_persists(self):
+        db = MicroDB(self.filename)
+        db['a'] = 1
+        db['a'] = 2
+        db['b'] = None
+        self.assertEqual(len(db), 2)
+        self.assertIn('a', db)
+        self.assertEqual(list(db), ['a', 'b'])
+        del db['a']
+        with self.assertRaises(KeyError):
+            del db['a']
+        self.assertEqual(MicroDB(self.filename).datastore, {'b': None})
+        db.clear()
+        self.assertEqual(MicroDB(self.filename).datastore, {})
+
+    def test_update_forms(self):
+        db = MicroDB(self.filename)
+        db['x'] = 0
+        self.assertTrue(db.update('x', 1))
+        self.assertFalse(db.update('missing', 1))
+        self.assertTrue(db.update('x', 2, False))
+        self.assertEqual(MicroDB(self.filename)['x'], 1)
+        db.update({'y': 2}, key='k', data='d')
+        db.update([('p', 0)])
+        db.update({'save': 's'}, save=False)
+        self.assertEqual(db.datastore, {'x': 2, 'y': 2, 'key': 'k', 'data': 'd', 'p': 0, 'save': 's'})
+        self.assertNotIn('save', MicroDB(self.filename).datastore)
+        with self.assertRaises(TypeError):
+            db.update('x', 1, True, 'extra')
+        with self.assertRaises(TypeError):
+            db.update('x', 1, foo=2)
+
+    def test_identity_semantics(self):
+        a = MicroDB(os.path.join(self.tmpdir, 'a.db'))
+        b = MicroDB(os.path.join(self.tmpdir, 'b.db'))
+        self.assertNotEqual(a, b)
+        self.assertNotEqual(a, {})
+        self.assertEqual(len({a, b}), 2)
+
+
+class TestJSON(MicroDBTestCase):
+    def test_to_json_load_json(self):
+        db = MicroDB(self.filename)
+        db['a'] = {'n': [1, 2]}
+        db['big'] = 123456789012345678901234567890
+        out = os.path.join(self.tmpdir, 'out.json')
+        db.to_json(out)
+        other = MicroDB(os.path.join(self.tmpdir, 'other.db'))
+        other.load_json(out)
+        self.assertEqual(MicroDB(other.filename).datastore, db.datastore)
+
+    def test_to_json_matches_json_module(self):
+        db = MicroDB(self.filename)
+        db['f'] = [float('inf'), float('-inf')]
+        db[1] = 'int key'
+        out = os.path.join(self.tmpdir, 'out.json')
+        db.to_json(out)
+        with open(out) as fd:
+            self.assertEqual(fd.read(), json.dumps(db.datastore))
+        db['d'] = datetime.date(2020, 1, 1)
+        with self.assertRaises(TypeError):
+            db.to_json(out)
+
+    def test_append_json(self):
+        path = self.write_json({'a': 1, 'b': 2})
+        db = MicroDB(self.filename)
+        db['a'] = 0
+        db.append_json(path)
+        self.assertEqual(MicroDB(self.filename).datastore, {'a': 0, 'b': 2})
+        db.append_json(path, duplicate=True)
+        self.assertEqual(MicroDB(self.filename).datastore, {'a': 1, 'b': 2})
+
+    @unittest.skipIf(microdb.ijson is None, "ijson not installed")
+    def test_streaming(self):
+        path = self.write_json({'a': 1.5, 'b': {'c': [1, 2]}})
+        db = MicroDB(self.filename)
+        db.load_json(path, streaming=True)
+        self.assertEqual(MicroDB(self.filename).datastore, {'a': 1.5, 'b': {'c': [1, 2]}})
+        db.datastore = {'a': 0}
+        db.append_json(path, streaming=True)
+        self.assertEqual(MicroDB(self.filename).datastore, {'a': 0, 'b': {'c': [1, 2]}})
+
+
+if __name__ == '__main__':
+    unittest.main()